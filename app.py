@@ -1,12 +1,17 @@
 import time
+import logging
 import threading
-import random
-from flask import Flask, jsonify, request
+from array import array
+from flask import Flask, request
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
+import orjson
 
+from puzzle_core import make_state, take_solvable_puzzle, start_pool_refiller
 from solver import SlidingPuzzleAStar  # Your A* solver from earlier
 
+log = logging.getLogger(__name__)
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'secret!'
 CORS(app)
@@ -14,75 +19,34 @@ CORS(app)
 # Initialize SocketIO (using eventlet or gevent as async_mode)
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 
+# Keep a few puzzles of each requested size ready so /api/new doesn't generate on demand
+start_pool_refiller()
+
 # Global puzzle data
-puzzle_state = []  # e.g., a list of length N*N
+puzzle_state = array('B')  # flattened N*N board, see puzzle_core.make_state
 puzzle_size = 4
-is_solving = False
+pos_map = []  # pos_map[tile] = index of tile in puzzle_state
+# Held while reading or replacing the board, so puzzle_state, pos_map and puzzle_size are
+# always seen together (the solver thread and request handlers both update them)
+board_lock = threading.Lock()
+# Set when the current auto-solve run should stop (or none is running); each run gets its own Event
+stop_event = threading.Event()
+stop_event.set()
 solver_thread = None
 
 num_moves = 0
 thinking_time = 0.0
 
-def find_position(tile):
-    """Return (row, col) of the given tile in puzzle_state, for the current puzzle_size."""
-    idx = puzzle_state.index(tile)
-    return divmod(idx, puzzle_size)
+def fast_json(payload):
+    """Like jsonify(payload), but serialized with orjson (much faster on large puzzle lists)."""
+    return app.response_class(orjson.dumps(payload), mimetype='application/json')
 
-def count_inversions(puzzle):
-    """
-    Count inversions in a 1D puzzle list (excluding 0).
-    An inversion is any pair (a, b) such that a appears before b, a > b, and both != 0.
-    """
-    arr = [x for x in puzzle if x != 0]
-    inversions = 0
-    for i in range(len(arr)):
-        for j in range(i + 1, len(arr)):
-            if arr[i] > arr[j]:
-                inversions += 1
-    return inversions
-
-def is_solvable(puzzle, n):
-    """
-    Check if an N x N puzzle is solvable.
-
-    Rules for NxN:
-      1) If N is odd:
-         - The puzzle is solvable if the number of inversions is even.
-      2) If N is even:
-         - Let 'row_of_blank_from_bottom' = row of the blank, counted from the bottom (1-based).
-         - The puzzle is solvable if:
-               (row_of_blank_from_bottom is even and number_of_inversions is odd) OR
-               (row_of_blank_from_bottom is odd  and number_of_inversions is even)
-    """
-    inv = count_inversions(puzzle)
-    hole_index = puzzle.index(0)
-    hole_row_from_top = hole_index // n
-    # Convert to 1-based row counting from bottom:
-    row_of_blank_from_bottom = n - hole_row_from_top
-
-    if n % 2 == 1:
-        # If grid width is odd, then puzzle is solvable if number of inversions is even
-        return (inv % 2 == 0)
-    else:
-        # If grid width is even, puzzle is solvable if:
-        # (blank is on even row counting from bottom and inversions is odd) OR
-        # (blank is on odd row counting from bottom and inversions is even)
-        return (
-            (row_of_blank_from_bottom % 2 == 0 and inv % 2 == 1) or
-            (row_of_blank_from_bottom % 2 == 1 and inv % 2 == 0)
-        )
-
-def generate_solvable_puzzle(n):
-    """
-    Generate a random, solvable puzzle for an NxN board.
-    Puzzle is represented by a list of length n*n with values [1..n*n-1] and 0 for the hole.
-    """
-    puzzle = list(range(1, n*n)) + [0]
-    # Shuffle until solvable
-    while True:
-        random.shuffle(puzzle)
-        if is_solvable(puzzle, n):
-            return puzzle
+def rebuild_pos_map():
+    """Recompute pos_map from puzzle_state; call (under board_lock) whenever puzzle_state is replaced."""
+    global pos_map
+    pos_map = [0] * len(puzzle_state)
+    for i, v in enumerate(puzzle_state):
+        pos_map[v] = i
 
 @app.route("/api/puzzle", methods=["GET"])
 def get_puzzle():
@@ -93,10 +57,11 @@ def get_puzzle():
         "puzzle": <list of length size*size>
       }
     """
-    return jsonify({
-        "size": puzzle_size,
-        "puzzle": puzzle_state
-    })
+    with board_lock:
+        return fast_json({
+            "size": puzzle_size,
+            "puzzle": puzzle_state.tolist()
+        })
 
 @app.route("/api/move", methods=["POST"])
 def move_tile():
@@ -108,26 +73,29 @@ def move_tile():
     data = request.get_json()
     tile_to_move = data.get("tile")
 
-    # Basic validation
-    if tile_to_move not in puzzle_state or tile_to_move == 0:
-        return jsonify({"error": "Invalid tile"}), 400
+    global num_moves
+    with board_lock:
+        # Basic validation: tiles are exactly 1..N*N-1, so a range check replaces
+        # scanning puzzle_state (`type(...) is int` also rejects JSON true/false)
+        if type(tile_to_move) is not int or not 0 < tile_to_move < len(pos_map):
+            return fast_json({"error": "Invalid tile"}), 400
 
-    # Current positions
-    tile_row, tile_col = find_position(tile_to_move)
-    hole_row, hole_col = find_position(0)
+        # Current positions
+        tile_idx = pos_map[tile_to_move]
+        hole_idx = pos_map[0]
+        tile_row, tile_col = divmod(tile_idx, puzzle_size)
+        hole_row, hole_col = divmod(hole_idx, puzzle_size)
 
-    global num_moves
-    num_moves += 1
+        num_moves += 1
 
-    # Check adjacency (Manhattan distance == 1)
-    if abs(tile_row - hole_row) + abs(tile_col - hole_col) == 1:
-        # Swap the tile with the hole
-        tile_idx = puzzle_state.index(tile_to_move)
-        hole_idx = puzzle_state.index(0)
-        puzzle_state[tile_idx], puzzle_state[hole_idx] = \
-            puzzle_state[hole_idx], puzzle_state[tile_idx]
+        # Check adjacency (Manhattan distance == 1)
+        if abs(tile_row - hole_row) + abs(tile_col - hole_col) == 1:
+            # Swap the tile with the hole
+            puzzle_state[tile_idx], puzzle_state[hole_idx] = \
+                puzzle_state[hole_idx], puzzle_state[tile_idx]
+            pos_map[tile_to_move], pos_map[0] = hole_idx, tile_idx
 
-    return jsonify({"size": puzzle_size, "puzzle": puzzle_state, "num_moves": num_moves})
+        return fast_json({"size": puzzle_size, "puzzle": puzzle_state.tolist(), "num_moves": num_moves})
 
 @app.route("/api/new", methods=["POST"])
 def new_puzzle():
@@ -149,15 +117,17 @@ def new_puzzle():
         new_size = int(new_size)
         if new_size < 2 or new_size > 50:
             # Example constraint: limit max to 50 for performance
-            return jsonify({"error": "Size must be between 2 and 50"}), 400
+            return fast_json({"error": "Size must be between 2 and 50"}), 400
     except (ValueError, TypeError):
-        return jsonify({"error": "Invalid size"}), 400
+        return fast_json({"error": "Invalid size"}), 400
 
     # Generate puzzle
-    puzzle_size = new_size
-    puzzle_state = generate_solvable_puzzle(puzzle_size)
-
-    return jsonify({"size": puzzle_size, "puzzle": puzzle_state})
+    new_state = take_solvable_puzzle(new_size)
+    with board_lock:
+        puzzle_size = new_size
+        puzzle_state = new_state
+        rebuild_pos_map()
+        return fast_json({"size": puzzle_size, "puzzle": puzzle_state.tolist()})
 
 # ----------------------------------------------------------------------
 # AUTO-SOLVE logic
@@ -165,20 +135,19 @@ def new_puzzle():
 
 @app.route("/api/auto_solve", methods=["POST"])
 def auto_solve():
-    global is_solving, solver_thread
+    global stop_event, solver_thread
     max_expansions = request.get_json().get('max_expansions', 50000)
     use_heuristic_adjustment = request.get_json().get('use_heuristic_adjustment', False)
-    if not is_solving:
-        is_solving = True
-        solver_thread = threading.Thread(target=run_solver, args=(max_expansions, use_heuristic_adjustment))
+    if stop_event.is_set():
+        stop_event = threading.Event()
+        solver_thread = threading.Thread(target=run_solver, args=(max_expansions, use_heuristic_adjustment, stop_event))
         solver_thread.start()
-    return jsonify({"status": "solver_started"})
+    return fast_json({"status": "solver_started"})
 
 @app.route("/api/stop_auto_solve", methods=["POST"])
 def stop_auto_solve():
-    global is_solving
-    is_solving = False
-    return jsonify({"status": "solver_stopped"})
+    stop_event.set()
+    return fast_json({"status": "solver_stopped"})
 
 @app.route("/api/set_state", methods=["POST"])
 def set_state():
@@ -195,29 +164,31 @@ def set_state():
     num_moves = 0
     thinking_time = 0.0
 
-    # Validate input
+    # Validate input (against puzzle_size, so under the same lock as the update)
     try:
-        # Check that we got a list of integers
-        if not isinstance(new_state, list) or not all(isinstance(x, int) for x in new_state):
-            return jsonify({"error": "Invalid puzzle format - must be list of integers"}), 400
+        with board_lock:
+            # Check that we got a list of integers
+            if not isinstance(new_state, list) or not all(isinstance(x, int) for x in new_state):
+                return fast_json({"error": "Invalid puzzle format - must be list of integers"}), 400
 
-        # Check length matches current size
-        if len(new_state) != puzzle_size * puzzle_size:
-            return jsonify({"error": f"Puzzle must be of length {puzzle_size * puzzle_size}"}), 400
+            # Check length matches current size
+            if len(new_state) != puzzle_size * puzzle_size:
+                return fast_json({"error": f"Puzzle must be of length {puzzle_size * puzzle_size}"}), 400
 
-        # Check numbers are valid (0 to N²-1)
-        valid_numbers = set(range(puzzle_size * puzzle_size))
-        if set(new_state) != valid_numbers:
-            return jsonify({"error": f"Puzzle must contain exactly numbers 0 to {puzzle_size * puzzle_size - 1}"}), 400
+            # Check numbers are valid (0 to N²-1)
+            valid_numbers = set(range(puzzle_size * puzzle_size))
+            if set(new_state) != valid_numbers:
+                return fast_json({"error": f"Puzzle must contain exactly numbers 0 to {puzzle_size * puzzle_size - 1}"}), 400
 
-        # Update puzzle state
-        puzzle_state = new_state
-        return jsonify({"size": puzzle_size, "puzzle": puzzle_state})
+            # Update puzzle state
+            puzzle_state = make_state(new_state, puzzle_size)
+            rebuild_pos_map()
+            return fast_json({"size": puzzle_size, "puzzle": puzzle_state.tolist()})
 
     except Exception as e:
-        return jsonify({"error": str(e)}), 400    
+        return fast_json({"error": str(e)}), 400    
 
-def run_solver(max_expansions, use_heuristic_adjustment):
+def run_solver(max_expansions, use_heuristic_adjustment, stop_event):
     """
     Runs the solver in repeated 'chunks' until puzzle is solved or user stops.
     Each iteration:
@@ -225,58 +196,72 @@ def run_solver(max_expansions, use_heuristic_adjustment):
       - Solve (partial or full)
       - Step through the returned path, updating puzzle + sending events
       - If partial, loop again from new state
+    Stops as soon as `stop_event` is set, including in the middle of a search.
     """
-    global is_solving, puzzle_state
+    global puzzle_state
 
     # print("Puzzle state: ", puzzle_state)
 
     global num_moves, thinking_time
 
-    while is_solving:
-        # Snapshot the puzzle state at this moment
-        current_state = puzzle_state[:]
-        # Create A* solver (set expansions limit as desired)
-        
-        solver = SlidingPuzzleAStar(
-            initial_state=current_state,
-            size=puzzle_size,
-            max_expansions=max_expansions,
-            use_heuristic_adjustment=use_heuristic_adjustment
-        )
+    solver = None
+
+    while not stop_event.is_set():
+        # Snapshot the puzzle state at this moment, so the board can't change under the solver
+        # (which packs it into its own int representation)
+        with board_lock:
+            current_state = tuple(puzzle_state)
+            current_size = puzzle_size
+
+        # Create the A* solver once (set expansions limit as desired) and resume it from
+        # the current state on later iterations; rebuild only if the board size changed.
+        if solver is None or solver.size != current_size:
+            solver = SlidingPuzzleAStar(
+                initial_state=current_state,
+                size=current_size,
+                max_expansions=max_expansions,
+                use_heuristic_adjustment=use_heuristic_adjustment,
+                verbose=False,  # keep the progress prints off the solver thread
+            )
         # Solve returns (path, solved)
         start_time = time.time()
-        path, solved = solver.solve()
+        path, solved = solver.resume(current_state, cancel_token=stop_event)
         end_time = time.time()
         thinking_time += end_time - start_time
 
-        print("Path: ", path)
-        print("Solved: ", solved)
+        if stop_event.is_set():
+            # Stopped mid-search; don't apply (or report on) the partial result
+            break
+
+        # (logging formats lazily, so the path is only repr'd when DEBUG is enabled)
+        log.debug("Solver returned %d states (solved=%s): %r", len(path), solved, path)
 
         # 'path' is a list of states from current_state -> best_node (partial or goal)
         if len(path) <= 1 and not use_heuristic_adjustment:
             # No progress possible? We'll break to avoid spinning endlessly
-            is_solving = False
+            stop_event.set()
             socketio.emit("solver_complete", {"message": "No progress possible (partial or unsolvable)."})
             break
 
-        print("Path: ", path)
-
         # Step through the path, updating puzzle at each step
         for idx, state in enumerate(path):
-            if not is_solving:
+            if stop_event.is_set():
                 # user or other event asked us to stop
                 break
 
-            puzzle_state = list(state)  # update global puzzle
+            with board_lock:
+                puzzle_state = make_state(state, current_size)  # update global puzzle
+                rebuild_pos_map()
+                board = puzzle_state.tolist()
 
-            print("emitting solver update")
+            log.debug("emit step %d/%d", idx, len(path))
 
             num_moves += 1
 
             # Emit to client
             socketio.emit("solver_update", {
-                "puzzle": puzzle_state,
-                "size": puzzle_size,
+                "puzzle": board,
+                "size": current_size,
                 "step": idx,
                 "total_steps": len(path),
                 "num_moves": num_moves,
@@ -286,14 +271,14 @@ def run_solver(max_expansions, use_heuristic_adjustment):
 
             # If this is the final step AND we found an actual solution
             if idx == len(path) - 1 and solved:
-                is_solving = False
+                stop_event.set()
                 socketio.emit("solver_complete", {"message": "Puzzle solved!"})
                 break
 
-            # Sleep to visually show the move (0.25s)
-            time.sleep(0.25)
+            # Sleep to visually show the move (0.25s), waking early on stop
+            stop_event.wait(0.25)
 
-        if not is_solving:
+        if stop_event.is_set():
             break
 
         # If we finished stepping through path but didn't solve, that means
@@ -305,7 +290,7 @@ def run_solver(max_expansions, use_heuristic_adjustment):
             break
 
     # Make sure we mark solver as no longer running
-    is_solving = False
+    stop_event.set()
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,154 @@
+import random
+import threading
+from array import array
+from collections import defaultdict, deque
+
+# Dedicated RNG for on-demand puzzle generation (seedable for warm-up / stress runs); the
+# pool refiller thread draws from its own, so seeding this one stays reproducible
+_rng = random.Random()
+_pool_rng = random.Random()
+
+# Pre-generated solvable puzzles per size, topped up by a background thread
+POOL_LOW_WATER = 8
+_puzzle_pool: dict[int, deque] = defaultdict(lambda: deque(maxlen=32))
+_pool_wakeup = threading.Event()
+
+
+def make_state(values, n):
+    """
+    Pack puzzle values into a compact array: 1 byte per cell when every tile fits
+    in uint8 (n <= 16), 2 bytes per cell above that.
+    """
+    return array('B' if n <= 16 else 'H', values)
+
+
+def count_inversions(puzzle):
+    """
+    Count inversions in a 1D puzzle list (excluding 0).
+    An inversion is any pair (a, b) such that a appears before b, a > b, and both != 0.
+
+    Tiles are exactly 1..len-1, so a Fenwick tree indexed by tile value counts, for each
+    tile, how many larger tiles were already seen -- O(N log N) with no recursion or slicing.
+    """
+    arr = [x for x in puzzle if x]
+    tree = [0] * (len(arr) + 1)
+    inversions = 0
+    for seen, tile in enumerate(arr):
+        # Number of already-seen tiles <= tile
+        smaller = 0
+        i = tile
+        while i > 0:
+            smaller += tree[i]
+            i -= i & -i
+        inversions += seen - smaller
+        i = tile
+        while i < len(tree):
+            tree[i] += 1
+            i += i & -i
+    return inversions
+
+
+def permutation_parity(puzzle):
+    """
+    Parity (0 or 1) of the inversion count of a 1D puzzle list (excluding 0), in O(N).
+
+    Inversion parity equals permutation parity, which we get by cycle decomposition:
+    a cycle of length k is made of (k - 1) transpositions.
+    """
+    perm = [x - 1 for x in puzzle if x != 0]  # tiles 1..m -> 0..m-1, used as indices
+    visited = bytearray(len(perm))
+    parity = 0
+    for start in range(len(perm)):
+        if visited[start]:
+            continue
+        cycle_length = 0
+        j = start
+        while not visited[j]:
+            visited[j] = 1
+            j = perm[j]
+            cycle_length += 1
+        parity ^= (cycle_length - 1) & 1
+    return parity
+
+
+def is_solvable(puzzle, n, hole_index=None):
+    """
+    Check if an N x N puzzle is solvable. Pass `hole_index` when the blank's
+    position is already known to skip searching the board for it.
+
+    Rules for NxN:
+      1) If N is odd:
+         - The puzzle is solvable if the number of inversions is even.
+      2) If N is even:
+         - Let 'row_of_blank_from_bottom' = row of the blank, counted from the bottom (1-based).
+         - The puzzle is solvable if:
+               (row_of_blank_from_bottom is even and number_of_inversions is odd) OR
+               (row_of_blank_from_bottom is odd  and number_of_inversions is even)
+    """
+    inv = permutation_parity(puzzle)
+    if hole_index is None:
+        hole_index = puzzle.index(0)
+    hole_row_from_top = hole_index // n
+    # Convert to 1-based row counting from bottom:
+    row_of_blank_from_bottom = n - hole_row_from_top
+
+    if n % 2 == 1:
+        # If grid width is odd, then puzzle is solvable if number of inversions is even
+        return (inv == 0)
+    else:
+        # If grid width is even, puzzle is solvable if:
+        # (blank is on even row counting from bottom and inversions is odd) OR
+        # (blank is on odd row counting from bottom and inversions is even)
+        return (
+            (row_of_blank_from_bottom % 2 == 0 and inv == 1) or
+            (row_of_blank_from_bottom % 2 == 1 and inv == 0)
+        )
+
+
+def generate_solvable_puzzle(n, rng=_rng):
+    """
+    Generate a random, solvable puzzle for an NxN board, drawing from `rng`.
+    Puzzle is represented by an array (see make_state) of length n*n with values
+    [1..n*n-1] and 0 for the hole.
+    """
+    # Shuffle the tiles and drop the blank into a random cell (the same uniform
+    # distribution as shuffling the whole board), so we know where it is
+    puzzle = make_state(range(1, n*n), n)
+    rng.shuffle(puzzle)
+    hole_index = rng.randrange(n*n)
+    puzzle.insert(hole_index, 0)
+    if not is_solvable(puzzle, n, hole_index):
+        # Swapping two non-blank tiles flips the inversion parity without moving
+        # the blank, which turns an unsolvable board into a solvable one.
+        i, j = (0, 1) if hole_index > 1 else (n*n - 1, n*n - 2)
+        puzzle[i], puzzle[j] = puzzle[j], puzzle[i]
+    return puzzle
+
+
+def take_solvable_puzzle(n):
+    """
+    Return a solvable NxN puzzle from the pre-generated pool, falling back to
+    generating one on demand when the pool for this size is empty.
+    """
+    pool = _puzzle_pool[n]
+    if len(pool) < POOL_LOW_WATER:
+        _pool_wakeup.set()
+    try:
+        return pool.popleft()
+    except IndexError:
+        return generate_solvable_puzzle(n)
+
+
+def _refill_pools():
+    while True:
+        _pool_wakeup.wait()
+        _pool_wakeup.clear()
+        for n in list(_puzzle_pool):
+            pool = _puzzle_pool[n]
+            while len(pool) < pool.maxlen:
+                pool.append(generate_solvable_puzzle(n, _pool_rng))
+
+
+def start_pool_refiller():
+    """Start the daemon thread that tops up each requested size's puzzle pool."""
+    threading.Thread(target=_refill_pools, daemon=True).start()
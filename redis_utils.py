@@ -1,14 +1,16 @@
 import redis as r
-from typing import Optional, Any
+from typing import Optional, Any, Iterator
 from redis_lock import Lock
-import json
+import orjson
 import time
 
-redis = r.Redis(connection_pool=r.ConnectionPool(host='localhost', port=6379, db=12))
+redis = r.Redis(connection_pool=r.ConnectionPool(
+    host='localhost', port=6379, db=12,
+    max_connections=64, health_check_interval=30, decode_responses=True,
+))
 
 def rget(key: str) -> Optional[str]:
-    raw_result = redis.get(key)
-    return raw_result.decode('utf-8') if raw_result is not None else None
+    return redis.get(key)
 
 
 def rget_int(key: str) -> Optional[int]:
@@ -30,9 +32,20 @@ def jsonKeys2int(x):
     return x
 
 
-def rget_json(key: str):
+def _keys_to_int_deep(x):
+    if isinstance(x, dict):
+        return jsonKeys2int({k: _keys_to_int_deep(v) for k, v in x.items()})
+    if isinstance(x, list):
+        return [_keys_to_int_deep(v) for v in x]
+    return x
+
+
+def rget_json(key: str, keys_to_int: bool = False):
     raw_result = rget(key)
-    return json.loads(raw_result, object_hook=jsonKeys2int) if raw_result is not None else None
+    if raw_result is None:
+        return None
+    value = orjson.loads(raw_result)
+    return _keys_to_int_deep(value) if keys_to_int else value
 
 
 def rset(key: str, value: Any, ex: Optional[int] = None) -> None:
@@ -40,7 +53,7 @@ def rset(key: str, value: Any, ex: Optional[int] = None) -> None:
 
 
 def rset_json(key: str, value: Any, ex: Optional[int] = None) -> None:
-    rset(key, json.dumps(value), ex=ex)
+    rset(key, orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS), ex=ex)
 
 
 def rdel(key: str) -> None:
@@ -51,40 +64,51 @@ def rlock(key: str, expire: int = 60) -> Lock:
     return Lock(redis, key, expire=expire)
 
 
+def riter_keys(pattern: str) -> Iterator[str]:
+    return redis.scan_iter(match=pattern, count=1000)
+
+
 def rkeys(pattern: str) -> list[str]:
-    return redis.keys(pattern)
+    return list(riter_keys(pattern))
+
+
+# Atomically decrement a counter and delete it once it reaches zero
+_decr_or_delete = redis.register_script("""
+local count = redis.call('decr', KEYS[1])
+if count <= 0 then
+    redis.call('del', KEYS[1])
+end
+return count
+""")
 
 
 class CodeBlockCounter:
 
     def __init__(self, key: str):
         self.key = key
-        self.lock = rlock(f"lock:{key}")
 
     def __enter__(self):
-        with self.lock:
-            count = rget(self.key)
-            if count is None:
-                rset(self.key, 1)
-            else:
-                rset(self.key, int(count) + 1)
+        redis.incr(self.key)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        with self.lock:
-            count = rget(self.key)
-            if count is not None and int(count) > 1:
-                rset(self.key, int(count) - 1)
-            else:
-                rdel(self.key)
-
-def await_empty_counter(key, max_time, time_increment):
-    for _ in range(int(max_time / time_increment)):
+        _decr_or_delete(keys=[self.key])
+
+def await_empty_counter(key, max_time, time_increment=0.005):
+    # Poll with exponential backoff: quick to notice a counter that empties right away,
+    # few round trips for one that takes a while. time_increment is the initial interval.
+    deadline = time.monotonic() + max_time
+    interval = time_increment
+    max_interval = max(time_increment, min(0.5, max_time / 4))
+    while True:
         if rget(key) is None:
             return
-        time.sleep(time_increment)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, max_interval)
     print("!!! Moves processing did not finish in time !!!")
     print(f"Key: {key}")
     print(f"Max time: {max_time}")
     print(f"Time increment: {time_increment}")
     return
-
@@ -1,219 +1,856 @@
-import heapq
 import math
-from typing import List, Tuple, Optional
-from redis_utils import rget, rset, rget_int
-
-def state_to_str(state: Tuple[int]) -> str:
-    return ",".join(map(str, state))
-
-def str_to_state(s: str) -> Tuple[int]:
-    return tuple(map(int, s.split(",")))
-
+import operator
+import threading
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Dict, List, Tuple, Optional, Sequence
+
+# Learned heuristic values (see use_heuristic_adjustment) per (board size, use_pattern_database),
+# since they are raised relative to that base heuristic, keyed by packed state. Each is an
+# OrderedDict kept in least-recently-used order (a value counts as used when it is raised,
+# or read by a search that expanded its state; see solve's adjustment pass) and capped at
+# HEURISTIC_CACHE_MAX_ENTRIES; an evicted state falls back to its base heuristic.
 heuristic_cache = {}
+# States whose learned value is at its fixed point given their neighbors' values (see
+# recompute_heuristic_for_state), keyed like heuristic_cache; a state leaves it when a
+# neighbor is raised. Only a memo, so it is simply emptied once it outgrows
+# HEURISTIC_CACHE_MAX_ENTRIES.
+settled_states = {}
+HEURISTIC_CACHE_MAX_ENTRIES = 1 << 20
+
+# How often (in expansions) solve() polls its cancel_token
+CANCEL_CHECK_INTERVAL = 1024
+
+# Tiles per disjoint pattern database (see use_pattern_database / _pattern_database)
+PATTERN_GROUP_SIZE = 4
+
+def _tile_bits(size: int) -> int:
+    """Bits per cell in a packed state: the smallest of 4/8/16 that holds every tile."""
+    cells = size * size
+    return 4 if cells <= 16 else 8 if cells <= 256 else 16
+
+@lru_cache(maxsize=None)
+def _distance_table(size: int) -> Tuple[bytes, ...]:
+    """
+    Manhattan distance lookup table for an N x N board: table[pos][tile] is the distance
+    from cell `pos` to tile's goal cell (0 for the blank). Rows are bytes, since no
+    distance exceeds 2*(N-1) <= 98 for the supported sizes. Built once per size.
+    """
+    tiles = range(1, size * size)
+    row_part = [bytes([0]) + bytes(abs(r - (t - 1) // size) for t in tiles) for r in range(size)]
+    col_part = [bytes([0]) + bytes(abs(c - (t - 1) % size) for t in tiles) for c in range(size)]
+    return tuple(
+        bytes(map(operator.add, row_part[pos // size], col_part[pos % size]))
+        for pos in range(size * size)
+    )
+
+@lru_cache(maxsize=None)
+def _byte_distance_table(size: int) -> Optional[Tuple[bytes, ...]]:
+    """
+    _distance_table regrouped by byte of a packed state's cell bits: table[k][byte] is the
+    summed distance of the cell(s) stored in byte k when it holds `byte`, so the Manhattan
+    distance is one lookup per byte, with no unpacking. Only for 4- and 8-bit cells
+    (None for 16-bit ones, whose 65536-entry rows wouldn't pay off). Built once per size.
+    """
+    bits = _tile_bits(size)
+    if bits > 8:
+        return None
+    cells = size * size
+    dist = _distance_table(size)
+    per_byte = 8 // bits
+    tile_mask = (1 << bits) - 1
+    table = []
+    for k in range((bits * cells + 7) // 8):
+        row = bytearray(256)
+        for byte in range(256):
+            for j in range(per_byte):
+                pos = k * per_byte + j
+                tile = (byte >> (bits * j)) & tile_mask
+                if pos < cells and tile < cells:
+                    row[byte] += dist[pos][tile]
+        table.append(bytes(row))
+    return tuple(table)
+
+@lru_cache(maxsize=None)
+def _move_table(size: int) -> Tuple[Tuple[int, ...], ...]:
+    """
+    For each blank index, the indices of the cells that can slide into it
+    (up, down, left, right, where in bounds). Built once per size.
+    """
+    table = []
+    for blank_index in range(size * size):
+        blank_row, blank_col = divmod(blank_index, size)
+        targets = []
+        if blank_row > 0:
+            targets.append(blank_index - size)  # up
+        if blank_row < size - 1:
+            targets.append(blank_index + size)  # down
+        if blank_col > 0:
+            targets.append(blank_index - 1)     # left
+        if blank_col < size - 1:
+            targets.append(blank_index + 1)     # right
+        table.append(tuple(targets))
+    return tuple(table)
+
+@lru_cache(maxsize=None)
+def _slide_table(size: int) -> Tuple[Tuple[Tuple[int, int, int, int, bool, int, int], ...], ...]:
+    """
+    _move_table with every per-move constant of a packed-state slide precomputed, so
+    neighbor generation is table lookups plus XORs: for each blank index, one
+    (new_index, tile_shift, blank_shift, index_flip, is_column, line_a, line_b) per move.
+
+    tile_shift/blank_shift are the bit offsets of the sliding tile's cell and the blank's
+    cell, index_flip XORs the cached blank index from the old cell to the new one, and
+    the tile's linear conflicts can only change if its goal column (is_column, for a
+    horizontal slide) or goal row is line_a or line_b, the lines it leaves and enters.
+    """
+    bits = _tile_bits(size)
+    index_shift = bits * size * size
+    table = []
+    for blank_index, targets in enumerate(_move_table(size)):
+        blank_row, blank_col = divmod(blank_index, size)
+        slides = []
+        for new_index in targets:
+            new_row, new_col = divmod(new_index, size)
+            is_column = new_row == blank_row
+            slides.append((
+                new_index,
+                bits * new_index,
+                bits * blank_index,
+                (blank_index ^ new_index) << index_shift,
+                is_column,
+                blank_col if is_column else blank_row,
+                new_col if is_column else new_row,
+            ))
+        table.append(tuple(slides))
+    return tuple(table)
+
+@lru_cache(maxsize=None)
+def _pruned_slide_table(size: int) -> Tuple[Dict[int, tuple], ...]:
+    """
+    _slide_table keyed by where the blank came from: table[blank_index][prev_blank] is
+    the blank's slides minus the one moving it back to prev_blank (-1 keeps them all),
+    so reverse-move pruning is one lookup instead of a comparison per move.
+    """
+    table = []
+    for slides in _slide_table(size):
+        by_prev = {-1: slides}
+        for slide in slides:
+            by_prev[slide[0]] = tuple(other for other in slides if other is not slide)
+        table.append(by_prev)
+    return tuple(table)
+
+@lru_cache(maxsize=None)
+def _pattern_database(size: int, tiles: Tuple[int, ...]) -> bytes:
+    """
+    Disjoint pattern database for `tiles` on an N x N board with N <= 4 (so a cell index
+    fits in 4 bits): table[placement | blank << 4*len(tiles)], where placement holds the
+    cell of tiles[i] in bits [4i, 4i+4), is the fewest moves *of these tiles* that bring
+    them all home from there, the other tiles being interchangeable and free to move.
+    Tables of disjoint groups add up to an admissible, consistent heuristic: a move only
+    changes the slid tile's group's entry, by at most 1.
+
+    Built by a 0-1 BFS back from the goal over the table's own indices (unreachable ones
+    stay 255), once per size and group.
+    """
+    moves = _move_table(size)
+    shift = 4 * len(tiles)
+    placement_mask = (1 << shift) - 1
+    slots = range(len(tiles))
+    goal = 0
+    for i, tile in enumerate(tiles):
+        goal |= (tile - 1) << (4 * i)
+    start = goal | ((size * size - 1) << shift)
+
+    table = bytearray([255]) * (1 << (shift + 4))
+    table[start] = 0
+    frontier = deque([start])
+    while frontier:
+        node = frontier.popleft()
+        node_cost = table[node]
+        placement = node & placement_mask
+        blank = node >> shift
+        for target in moves[blank]:
+            for i in slots:
+                if ((placement >> (4 * i)) & 0xF) == target:
+                    # A pattern tile slides into the blank: one move
+                    next_node = (placement ^ ((target ^ blank) << (4 * i))) | (target << shift)
+                    if node_cost + 1 < table[next_node]:
+                        table[next_node] = node_cost + 1
+                        frontier.append(next_node)
+                    break
+            else:
+                # Some other tile slides: free
+                next_node = placement | (target << shift)
+                if node_cost < table[next_node]:
+                    table[next_node] = node_cost
+                    frontier.appendleft(next_node)
+    return bytes(table)
+
+def _conflict_penalty(goal_positions: Sequence[int]) -> int:
+    """
+    Linear-conflict penalty for one row/column, given the goal positions (along that line)
+    of the tiles in it that belong to it, in their current order. All but a longest
+    increasing subsequence of them must leave the line and come back: 2 moves each.
+    """
+    tails = []
+    for x in goal_positions:
+        i = bisect_left(tails, x)
+        if i == len(tails):
+            tails.append(x)
+        else:
+            tails[i] = x
+    return 2 * (len(goal_positions) - len(tails))
 
 class SlidingPuzzleAStar:
     """
-    A solver for an N x N sliding-tile puzzle using A* with summed Manhattan distance.
+    A solver for an N x N sliding-tile puzzle using A* with summed Manhattan distance
+    plus linear conflicts.
+
+    Internally a state is packed into a single int: cell i occupies bits
+    [i*b, (i+1)*b) for b = _tile_bits(size), and the blank's index is stored above
+    the tiles so neighbor generation never has to search for it. Paths are unpacked
+    back to tuples before being returned. Packed states are canonical dict keys (equal
+    boards are equal ints, hashed from a few machine words), so the search dicts need
+    no tuple interning.
     """
-    def __init__(self, initial_state: List[int], size: int, max_expansions: int = 100000, use_heuristic_adjustment: bool = False):
+    def __init__(self, initial_state: Sequence[int], size: int, max_expansions: int = 100000, use_heuristic_adjustment: bool = False,
+                 use_ida: bool = False, verbose: bool = True, lazy_heuristic: bool = False,
+                 use_pattern_database: bool = False):
         """
-        :param initial_state: Flattened puzzle as a list of length N*N, with `0` for the blank.
+        :param initial_state: Flattened puzzle of length N*N (list, tuple or bytes), with `0` for the blank.
         :param size: N (e.g., 4 for a 4x4 puzzle).
         :param max_expansions: Maximum expansions before early stopping.
+        :param use_heuristic_adjustment: Learn raised heuristic values across A* runs.
+        :param use_ida: Make resume() search with solve_ida() instead of A* solve().
+        :param verbose: Print search progress (every 100 A* expansions) and how each search ended.
+        :param lazy_heuristic: In A*, settle linear conflicts only for nodes that get popped
+            (Lazy A*). Pays off when most generated nodes are never expanded; with the
+            incremental deltas it's about break-even on typical searches, so off by default.
+        :param use_pattern_database: Use additive pattern databases over groups of
+            PATTERN_GROUP_SIZE tiles as base_heuristic, instead of Manhattan distance plus
+            linear conflicts. Boards up to 4x4 only; the tables take a few seconds to build
+            the first time per size.
         """
         self.size = size
-        self.initial_state = tuple(initial_state)
-        self.goal_state = tuple(range(1, size * size)) + (0,)
+        self._bits = _tile_bits(size)
+        self._tile_mask = (1 << self._bits) - 1
+        self._blank_shift = self._bits * size * size
+        self._cells_mask = (1 << self._blank_shift) - 1
+
+        self.initial_state = self._pack(initial_state)
+        self.goal_state = self._pack(tuple(range(1, size * size)) + (0,))
         self.use_heuristic_adjustment = use_heuristic_adjustment
         self.max_expansions = max_expansions
+        self.verbose = verbose
+        self.lazy_heuristic = lazy_heuristic
+        # The search strategy resume() runs
+        self._search = self.solve_ida if use_ida else self.solve
+
+        # Manhattan distance lookup table, kept across resume() calls (see _distance_table)
+        self._dist = _distance_table(size)
+        self._byte_dist = _byte_distance_table(size)
+        self._slides = _slide_table(size)
+        self._pruned_slides = _pruned_slide_table(size)
+        # Goal (row, col) of each tile, indexed by tile value, for linear conflicts
+        self._goal_row = (0,) + tuple((tile - 1) // size for tile in range(1, size * size))
+        self._goal_col = (0,) + tuple((tile - 1) % size for tile in range(1, size * size))
+        # Bit offsets of the cells of each row / column, in order along the line
+        self._row_shifts = tuple(tuple(self._bits * (r * size + c) for c in range(size)) for r in range(size))
+        self._col_shifts = tuple(tuple(self._bits * (r * size + c) for r in range(size)) for c in range(size))
+
+        # Pattern databases (see _pattern_database), when they replace Manhattan + linear conflicts
+        self._pattern_groups = None
+        if use_pattern_database:
+            if size > 4:
+                raise ValueError("Pattern databases are only built for boards up to 4x4")
+            tiles = range(1, size * size)
+            # Groups are runs of consecutive tiles, so in a tile-positions int (see
+            # _tile_positions) each group's placement is one contiguous bit field. Per group:
+            # (table, offset of that field, its mask, where the blank's cell goes in the index)
+            groups = [tuple(tiles[i:i + PATTERN_GROUP_SIZE]) for i in range(0, len(tiles), PATTERN_GROUP_SIZE)]
+            self._pattern_groups = tuple(
+                (_pattern_database(size, group), 4 * (group[0] - 1), (1 << (4 * len(group))) - 1, 4 * len(group))
+                for group in groups
+            )
+            # For each tile: its group's entry plus the offset of the tile's own cell
+            self._pattern_slot = (None,) + tuple(
+                self._pattern_groups[(tile - 1) // PATTERN_GROUP_SIZE] + (4 * (tile - 1),) for tile in tiles
+            )
+
+        # Learned values only hold against the base heuristic they were raised over
+        learned_key = (size, self._pattern_groups is not None)
+        self._heuristic_cache = heuristic_cache.setdefault(learned_key, OrderedDict())
+        self._settled = settled_states.setdefault(learned_key, set())
+
+    def resume(self, initial_state: Sequence[int], max_expansions: Optional[int] = None,
+               cancel_token: Optional[threading.Event] = None) -> Tuple[List[Tuple[int, ...]], bool]:
+        """
+        Solve again from a new initial state (e.g. the end of a previous partial path),
+        reusing this solver's precomputed tables instead of building a new solver.
+        """
+        self.initial_state = self._pack(initial_state)
+        if max_expansions is not None:
+            self.max_expansions = max_expansions
+        return self._search(cancel_token=cancel_token)
 
-    def recompute_heuristic_for_state(self, state: Tuple[int]) -> None:
-        current_heuristic = self.heuristic(state)
-        min_neighbor_heuristic = min(self.heuristic(neighbor) for neighbor in self.get_neighbors(state))
+    def _pack(self, state: Sequence[int]) -> int:
+        """
+        Pack a flattened board (any int sequence: list, tuple, bytes or array) into this
+        solver's int representation. States only exist as tuples again when unpacked.
+        """
+        bits = self._bits
+        packed = 0
+        blank_index = 0
+        for index in range(len(state) - 1, -1, -1):
+            tile = state[index]
+            if tile == 0:
+                blank_index = index
+            packed = (packed << bits) | tile
+        return packed | (blank_index << self._blank_shift)
+
+    def _unpack(self, packed: int) -> Tuple[int, ...]:
+        """Inverse of _pack: the flattened board as a tuple."""
+        cells = self.size * self.size
+        raw = (packed & self._cells_mask).to_bytes((self._blank_shift + 7) // 8, 'little')
+        if self._bits == 4:
+            return tuple(nibble for byte in raw for nibble in (byte & 0xF, byte >> 4))[:cells]
+        width = self._bits // 8
+        return tuple(int.from_bytes(raw[i:i + width], 'little') for i in range(0, cells * width, width))
+
+    def recompute_heuristic_for_state(self, state: int, base_h: Optional[int] = None) -> None:
+        """
+        Raise the learned heuristic of `state` to 1 + its best neighbor's if it isn't already
+        above it. `base_h` is the state's base_heuristic, when the caller already knows it.
+        Skipped for settled states, whose neighbors haven't changed since they were checked.
+        """
+        settled = self._settled
+        if state in settled:
+            return
+        if len(settled) >= HEURISTIC_CACHE_MAX_ENTRIES:
+            settled.clear()
+        if base_h is None:
+            base_h = self.base_heuristic(state)
+        learned = self._heuristic_cache
+        current_heuristic = learned.get(state, base_h)
+        neighbors = self._neighbors_with_delta(state)
+        min_neighbor_heuristic = min(learned.get(neighbor, base_h + delta) for neighbor, delta, _ in neighbors)
+        settled.add(state)
         # print(f"Current heuristic for {state}: {current_heuristic}, min neighbor heuristic: {min_neighbor_heuristic}")
 
         if min_neighbor_heuristic >= current_heuristic:
             # print(f"Updating heuristic for {state} from {current_heuristic} to {min_neighbor_heuristic + 1}")
 
-            heuristic_cache[state_to_str(state)] = min_neighbor_heuristic + 1
-
-    def solve(self) -> Tuple[List[Tuple[int]], bool]:
-        print(f"Starting A* for {self.size}x{self.size}, initial f = {self.heuristic(self.initial_state)}")
+            learned[state] = min_neighbor_heuristic + 1
+            learned.move_to_end(state)
+            if len(learned) > HEURISTIC_CACHE_MAX_ENTRIES:
+                evicted, _ = learned.popitem(last=False)
+                # Back on its base heuristic, so no longer at its fixed point
+                settled.discard(evicted)
+            # The neighbors' own fixed points depend on this value
+            settled.difference_update(neighbor for neighbor, _, _ in neighbors)
 
+    def solve(self, cancel_token: Optional[threading.Event] = None) -> Tuple[List[Tuple[int, ...]], bool]:
+        """
+        Run A* until the goal is found, `max_expansions` is hit, or `cancel_token` is set.
+        Returns (path, solved); when not solved, path leads to the best-h node found so far.
+        """
         if self.initial_state == self.goal_state:
-            return ([self.initial_state], True)
-
-        open_list = []
-        heapq.heapify(open_list)
-
-        # g-scores and came_from logic as before
-        g_scores = {self.initial_state: 0}
-        came_from = {}
-        f_initial = self.heuristic(self.initial_state)
+            return ([self._unpack(self.initial_state)], True)
 
-        # (f, g, state, parent_state)
-        heapq.heappush(open_list, (f_initial, 0, self.initial_state, None))
+        # The base heuristic (without learned adjustments) rides along with each node so
+        # that a neighbor's value is a cheap update of its parent's, not a full recomputation.
+        # This is the only full evaluation in the search.
+        base_h_initial = self.base_heuristic(self.initial_state)
+        h_initial = base_h_initial
+        if self.use_heuristic_adjustment:
+            h_initial = self._heuristic_cache.get(self.initial_state, base_h_initial)
+        f_initial = h_initial
+        if self.verbose:
+            print(f"Starting A* for {self.size}x{self.size}, initial f = {f_initial}")
+
+        # g-scores, keyed by packed state. There is no separate came_from map: every state's
+        # parent is a neighbor with a lower g-score, so paths are recovered from g_scores
+        # alone (see _reconstruct_path)
+        g_scores: Dict[int, int] = {self.initial_state: 0}
+
+        # Open list as a bucket queue: f-values are small integers, so open_list[f] holds the
+        # (g, base_h, state, prev_blank, carry) entries with that f, and f_min is the lowest bucket
+        # that may be non-empty. Push and pop are O(1), and popping from the end of a bucket
+        # breaks f-ties in favour of the most recently generated (deepest) node. Entries stay
+        # tuples rather than parallel typed arrays: a 4x4 packed state (with its blank index)
+        # is already wider than 64 bits, and array() would box/unbox every field on each
+        # append and pop, where a tuple just holds the existing int objects.
+        open_list: List[list] = [[] for _ in range(f_initial + 1)]
+        open_list[f_initial].append((0, base_h_initial, self.initial_state, -1, None))
+        f_min = f_initial
+        # open_list[f_min], kept in hand: most pops and many pushes (a consistent heuristic
+        # keeps f flat along good moves) touch only this bucket
+        bucket = open_list[f_min]
 
         expansions = 0
 
         # Two "best" trackers:
-        best_f_node_so_far = (f_initial, 0, self.initial_state, None)
-        # For best_h_node_so_far, store a tuple: (h_value, g, state, parent_state)
-        h_initial = self.heuristic(self.initial_state)
-        best_h_node_so_far = (h_initial, 0, self.initial_state, None)
-
-        states_to_recompute = []
-
-        while open_list:
-            f_current, g_current, current_state, parent_state = heapq.heappop(open_list)
-
-            if expansions % 100 == 0:
-                print(f"Expansions: {expansions}, f_current={f_current}, h_current={self.heuristic(current_state)}")
+        best_f_node_so_far = (f_initial, 0, self.initial_state, -1)
+        # For best_h_node_so_far, store a tuple: (h_value, g, state, prev_blank)
+        best_h_node_so_far = (h_initial, 0, self.initial_state, -1)
+
+        # Base heuristic of each state expanded in adjustment mode: the adjustment pass at the
+        # expansion limit only revisits states the search actually expanded (as in real-time
+        # A* variants), not the far larger set it merely generated
+        states_to_recompute: Dict[int, int] = {}
+
+        # Learned values only exist in adjustment mode; they are looked up directly (never
+        # recomputed) since every node already carries its base heuristic
+        learned = self._heuristic_cache if self.use_heuristic_adjustment else None
+        # Lazy linear conflicts: a child whose move may change them is pushed with an
+        # optimistic base_h and settled only if it is popped (see _neighbors_with_delta).
+        # Not with learned values, whose bookkeeping needs every pushed base_h exact, nor
+        # pattern databases, whose neighbor deltas are already just two table lookups.
+        lazy = self.lazy_heuristic and learned is None and self._pattern_groups is None
+
+        # Hot-loop lookups bound to locals once, rather than attribute lookups per node
+        get_g = g_scores.get
+        blank_shift = self._blank_shift
+        neighbors_with_delta = self._neighbors_with_delta
+        lazy_correction = self._lazy_correction
+        goal_state = self.goal_state
+        max_expansions = self.max_expansions
+        verbose = self.verbose
+        # Expansions between progress prints / cancel_token polls (see the loop)
+        poll_interval = 100 if verbose else CANCEL_CHECK_INTERVAL
+        checkpoint = 0
+
+        while True:
+            # Advance to the lowest non-empty bucket
+            while not bucket and f_min + 1 < len(open_list):
+                f_min += 1
+                bucket = open_list[f_min]
+            if not bucket:
+                break
+            f_current = f_min
+            g_current, base_h_current, current_state, prev_blank, carry = bucket.pop()
+            if g_current > g_scores[current_state]:
+                # Lazy deletion: a cheaper path to this state was pushed after this entry
+                continue
+            if lazy and carry is not None:
+                correction = lazy_correction(current_state, prev_blank, carry)
+                if correction:
+                    # Its true f is higher: back into the open list, now exact
+                    f_settled = f_current + correction
+                    if f_settled >= len(open_list):
+                        open_list.extend([] for _ in range(f_settled + 1 - len(open_list)))
+                    open_list[f_settled].append((g_current, base_h_current + correction, current_state, prev_blank, None))
+                    continue
+
+            # h was fixed when the node was pushed (learned values only change after the search)
+            h_current = f_current - g_current
 
             # Update best f
             if f_current < best_f_node_so_far[0]:
-                best_f_node_so_far = (f_current, g_current, current_state, parent_state)
+                best_f_node_so_far = (f_current, g_current, current_state, prev_blank)
 
             # Update best h
-            h_current = self.heuristic(current_state)
             if h_current < best_h_node_so_far[0]:
-                best_h_node_so_far = (h_current, g_current, current_state, parent_state)
-
-            # Early stop?
-            if expansions >= self.max_expansions:
-                print(f"Reached max expansions = {self.max_expansions}, stopping early")
-
-                # Option A: Return partial path that is best by f
-                # partial_path = self._reconstruct_partial_path(best_f_node_so_far, came_from)
-                
-                # Option B: Return partial path that is best by h
-                partial_path = self._reconstruct_partial_path(best_h_node_so_far, came_from)
-
-                # # Recompute heuristic for states that have changed
-                # print("recomputing heuristic for states: ", states_to_recompute)
+                best_h_node_so_far = (h_current, g_current, current_state, prev_blank)
+
+            # Progress, cancellation and the expansion limit only need looking at every so
+            # often, so a single comparison per expansion stands in for all three
+            if expansions >= checkpoint:
+                if verbose:
+                    print(f"Expansions: {expansions}, f_current={f_current}, h_current={h_current}")
+                # Cancelled by the caller?
+                if cancel_token is not None and cancel_token.is_set():
+                    if verbose:
+                        print(f"Cancelled after {expansions} expansions")
+                    return self._reconstruct_partial_path(best_h_node_so_far, g_scores), False
+                # Early stop?
+                if expansions >= max_expansions:
+                    if verbose:
+                        print(f"Reached max expansions = {self.max_expansions}, stopping early")
+
+                    # Option A: Return partial path that is best by f
+                    # partial_path = self._reconstruct_partial_path(best_f_node_so_far, g_scores)
+
+                    # Option B: Return partial path that is best by h
+                    partial_path = self._reconstruct_partial_path(best_h_node_so_far, g_scores)
+
+                    # # Recompute heuristic for states that have changed
+                    # print("recomputing heuristic for states: ", states_to_recompute)
 
-                states_to_recompute_sorted_by_heuristic = sorted(states_to_recompute, key=lambda state: self.heuristic(state))
-                if self.use_heuristic_adjustment:
-                    for state in states_to_recompute_sorted_by_heuristic:
-                        self.recompute_heuristic_for_state(state)
-
-                return partial_path, False
+                    if self.use_heuristic_adjustment:
+                        # Visit states in increasing heuristic order. h-values are small integers,
+                        # so bucket them (like open_list) instead of sorting (h, base_h, state) tuples
+                        states_by_heuristic: List[list] = []
+                        for state, base_h in states_to_recompute.items():
+                            h = learned.get(state)
+                            if h is None:
+                                h = base_h
+                            else:
+                                # Read by this search: refresh its recency once here rather
+                                # than on every lookup in the loop above
+                                learned.move_to_end(state)
+                            if h >= len(states_by_heuristic):
+                                states_by_heuristic.extend([] for _ in range(h + 1 - len(states_by_heuristic)))
+                            states_by_heuristic[h].append((state, base_h))
+                        recompute = self.recompute_heuristic_for_state
+                        for same_h in states_by_heuristic:
+                            for state, base_h in same_h:
+                                recompute(state, base_h)
+
+                    return partial_path, False
+
+                checkpoint = min(expansions + poll_interval, max_expansions)
 
             expansions += 1
 
-            # Record parent if needed
-            if parent_state is not None and current_state not in came_from:
-                came_from[current_state] = parent_state
-
             # Goal check
-            if current_state == self.goal_state:
-                print(f"Solution found after {expansions} expansions")
-                return (self._reconstruct_path(current_state, came_from), True)
+            if current_state == goal_state:
+                if verbose:
+                    print(f"Solution found after {expansions} expansions")
+                return (self._reconstruct_path(current_state, g_scores), True)
+
+            if learned is not None:
+                states_to_recompute[current_state] = base_h_current
 
             # Expand neighbors
-            for next_state in self.get_neighbors(current_state):
-                g_next = g_current + 1
-                if next_state not in g_scores or g_next < g_scores[next_state]:
+            g_next = g_current + 1
+            # Children record this node's blank index, the only thing they need of their parent
+            blank_index = current_state >> blank_shift
+            for next_state, h_delta, next_carry in neighbors_with_delta(current_state, prev_blank, lazy, carry):
+                g_seen = get_g(next_state)
+                if g_seen is None or g_next < g_seen:
                     g_scores[next_state] = g_next
-                    f_next = g_next + self.heuristic(next_state)
-
-                    if self.use_heuristic_adjustment:
-                        states_to_recompute.append(next_state)
-
-                    heapq.heappush(open_list, (f_next, g_next, next_state, current_state))
+                    base_h_next = base_h_current + h_delta
+                    h_next = base_h_next if learned is None else learned.get(next_state, base_h_next)
+                    f_next = g_next + h_next
+
+                    entry = (g_next, base_h_next, next_state, blank_index, next_carry)
+                    if f_next == f_min:
+                        bucket.append(entry)
+                    else:
+                        if f_next >= len(open_list):
+                            open_list.extend([] for _ in range(f_next + 1 - len(open_list)))
+                        open_list[f_next].append(entry)
+                        # Learned values need not be consistent, so f can drop below f_min
+                        if f_next < f_min:
+                            f_min = f_next
+                            bucket = open_list[f_min]
 
         # If we exhaust open_list with no solution:
-        print("Search exhausted, no solution found (shouldn't happen if solvable).")
-        partial_path = self._reconstruct_partial_path(best_h_node_so_far, came_from)
+        if verbose:
+            print("Search exhausted, no solution found (shouldn't happen if solvable).")
+        partial_path = self._reconstruct_partial_path(best_h_node_so_far, g_scores)
         return partial_path, False
 
 
-    def get_neighbors(self, state: Tuple[int]) -> List[Tuple[int]]:
+    def solve_ida(self, cancel_token: Optional[threading.Event] = None) -> Tuple[List[Tuple[int, ...]], bool]:
+        """
+        Iterative-deepening A*: repeated depth-first searches bounded by f = g + h, each
+        raising the bound to the smallest f that exceeded the previous one. Memory is
+        O(depth) plus a transposition table of the current iteration (state -> smallest g
+        seen), instead of A*'s open list and per-state dicts. The depth-first search runs
+        on an explicit stack, so long paths on big boards don't hit the recursion limit.
+
+        Uses base_heuristic (learned adjustments are ignored). Like solve(), stops after
+        max_expansions or when `cancel_token` is set, returning (path, solved) where an
+        unsolved path leads to the best-h state found.
+        """
+        if self.initial_state == self.goal_state:
+            return ([self._unpack(self.initial_state)], True)
+
+        goal_state = self.goal_state
+        blank_shift = self._blank_shift
+        neighbors_with_delta = self._neighbors_with_delta
+        max_expansions = self.max_expansions
+        verbose = self.verbose
+
+        h_initial = self.base_heuristic(self.initial_state)
+        best_h, best_path = h_initial, [self.initial_state]
+        expansions = 0
+
+        bound = h_initial
+        while True:
+            transpositions = {self.initial_state: 0}
+            # path holds the states from the start to the node being expanded, and stack one
+            # (g, h, remaining children) frame per node of path that has been expanded
+            path = [self.initial_state]
+            stack = []
+            minimum = math.inf
+            state, g, h, carry = self.initial_state, 0, h_initial, None
+
+            while True:
+                # `state` (path[-1]) is within the bound: expand it
+                if state == goal_state:
+                    if verbose:
+                        print(f"IDA* solution found after {expansions} expansions")
+                    return [self._unpack(state) for state in path], True
+                if h < best_h:
+                    best_h, best_path = h, list(path)
+                if expansions >= max_expansions or (
+                        cancel_token is not None and expansions % CANCEL_CHECK_INTERVAL == 0
+                        and cancel_token.is_set()):
+                    if verbose:
+                        print(f"IDA* stopped after {expansions} expansions (bound = {bound})")
+                    return [self._unpack(state) for state in best_path], False
+                expansions += 1
+                # Don't undo the move that led here
+                prev_blank = path[-2] >> blank_shift if len(path) > 1 else -1
+                stack.append((g, h, iter(neighbors_with_delta(state, prev_blank, False, carry))))
+
+                # Descend into the next child within the bound, backtracking out of nodes
+                # whose children are used up
+                while stack:
+                    g, h, children = stack[-1]
+                    for next_state, h_delta, next_carry in children:
+                        seen_g = transpositions.get(next_state)
+                        if seen_g is not None and seen_g <= g + 1:
+                            continue
+                        transpositions[next_state] = g + 1
+                        f = g + 1 + h + h_delta
+                        if f > bound:
+                            if f < minimum:
+                                minimum = f
+                            continue
+                        path.append(next_state)
+                        state, g, h, carry = next_state, g + 1, h + h_delta, next_carry
+                        break
+                    else:
+                        stack.pop()
+                        path.pop()
+                        continue
+                    break
+                else:
+                    # This iteration's tree is exhausted
+                    break
+
+            if minimum == math.inf:
+                if verbose:
+                    print(f"IDA* stopped after {expansions} expansions (bound = {bound})")
+                return [self._unpack(state) for state in best_path], False
+            bound = minimum
+
+    def get_neighbors(self, state: int) -> List[int]:
         """
         Return all valid neighbor states by sliding one tile adjacent to the blank.
+        Straight from the per-blank slide table, without _neighbors_with_delta's
+        heuristic bookkeeping.
         """
         neighbors = []
-        size = self.size
+        tile_mask = self._tile_mask
+        for _, tile_shift, blank_shift, index_flip, _, _, _ in self._slides[state >> self._blank_shift]:
+            tile = (state >> tile_shift) & tile_mask
+            neighbors.append(state ^ (tile << blank_shift) ^ (tile << tile_shift) ^ index_flip)
+        return neighbors
 
-        # print("State: ", state)
-        blank_index = state.index(0)
-        blank_row = blank_index // size
-        blank_col = blank_index % size
+    def _neighbors_with_delta(self, state: int, prev_blank: int = -1, lazy: bool = False,
+                              carry=None) -> List[Tuple[int, int, object]]:
+        """
+        Like get_neighbors, but each neighbor comes as (neighbor, delta, carry) with its
+        change in base_heuristic, and the move back into `prev_blank` (the parent's blank
+        index) is skipped. `carry` is what came with `state` itself; only the
+        pattern-database heuristic reads it (see _pattern_neighbors_with_delta).
+        Only the slid tile moves, so its Manhattan term is the only one that changes, and
+        at most one line's linear conflicts change: the tile's goal column (for a horizontal
+        slide) or goal row (for a vertical one), if the tile enters or leaves it.
+
+        Such a move's delta is always -1 or +1 (entering the line brings the tile closer
+        but may add 2 conflict moves; leaving it is the reverse). With `lazy`, its line isn't
+        scanned: delta is the optimistic -1 and carry is (line, is_column, manhattan delta)
+        for _lazy_correction; otherwise (and for every other move) carry is None.
+        """
+        if self._pattern_groups is not None:
+            return self._pattern_neighbors_with_delta(state, prev_blank, carry)
 
-        # Potential moves: up, down, left, right (if in-bounds)
-        moves = []
-        if blank_row > 0:
-            moves.append((-1, 0))  # up
-        if blank_row < size - 1:
-            moves.append((1, 0))   # down
-        if blank_col > 0:
-            moves.append((0, -1))  # left
-        if blank_col < size - 1:
-            moves.append((0, 1))   # right
-
-        for dr, dc in moves:
-            new_row = blank_row + dr
-            new_col = blank_col + dc
-            new_index = new_row * size + new_col
-            # Swap blank and the tile in new_index
-            neighbor_list = list(state)
-            neighbor_list[blank_index], neighbor_list[new_index] = \
-                neighbor_list[new_index], neighbor_list[blank_index]
-            neighbors.append(tuple(neighbor_list))
+        # A handful of neighbors per call: per-call setup is kept to local bindings, and
+        # each neighbor is a few XORs on the packed int (no array copies or batching)
+        neighbors = []
+        append = neighbors.append
+        tile_mask = self._tile_mask
+        dist = self._dist
+        goal_rows = self._goal_row
+        goal_cols = self._goal_col
+        line_conflicts = self._line_conflicts
+
+        # The blank's index is cached above the tile bits
+        blank_index = state >> self._blank_shift
+        blank_dist = dist[blank_index]
+
+        # (the move back to prev_blank would only regenerate the parent, which never needs a cheaper g)
+        slides = self._pruned_slides[blank_index][prev_blank]
+        for new_index, tile_shift, blank_shift, index_flip, is_column, line_a, line_b in slides:
+            # Swap blank and the tile in new_index: the blank cell holds 0, so XOR-ing the
+            # tile into both cells moves it, and the cached blank index becomes new_index
+            tile = (state >> tile_shift) & tile_mask
+            neighbor = state ^ (tile << blank_shift) ^ (tile << tile_shift) ^ index_flip
+            # The tile slides from new_index into the blank's cell
+            delta = blank_dist[tile] - dist[new_index][tile]
+            # Horizontal slides can only change the tile's goal column, vertical its goal row
+            line = goal_cols[tile] if is_column else goal_rows[tile]
+            if line == line_a or line == line_b:
+                if lazy:
+                    append((neighbor, -1, (line, is_column, delta)))
+                    continue
+                delta += line_conflicts(neighbor, line, is_column) - line_conflicts(state, line, is_column)
+            append((neighbor, delta, None))
+
+        return neighbors
 
+    def _pattern_neighbors_with_delta(self, state: int, prev_blank: int = -1,
+                                      positions: Optional[int] = None) -> List[Tuple[int, int, int]]:
+        """
+        _neighbors_with_delta under the pattern-database heuristic: only the slid tile's
+        group's entry can change, so each delta is the difference of two entries of one table.
+        `positions` is the state's _tile_positions, and each neighbor's comes back as its
+        carry, updated in the slid tile's 4 bits; the board is only scanned when it's missing.
+        """
+        if positions is None:
+            positions = self._tile_positions(state)
+        neighbors = []
+        append = neighbors.append
+        tile_mask = self._tile_mask
+        slot = self._pattern_slot
+        blank_index = state >> self._blank_shift
+        for new_index, tile_shift, blank_shift, index_flip, _, _, _ in self._pruned_slides[blank_index][prev_blank]:
+            tile = (state >> tile_shift) & tile_mask
+            neighbor = state ^ (tile << blank_shift) ^ (tile << tile_shift) ^ index_flip
+            table, offset, mask, shift, tile_offset = slot[tile]
+            # The tile moves from new_index to the blank's cell, where the blank was
+            next_positions = positions ^ ((new_index ^ blank_index) << tile_offset)
+            delta = (table[((next_positions >> offset) & mask) | (new_index << shift)]
+                     - table[((positions >> offset) & mask) | (blank_index << shift)])
+            append((neighbor, delta, next_positions))
         return neighbors
 
-    def heuristic(self, state: Tuple[int], depth: int = 1) -> int:
-        # if (candidate_heuristic_val := rget_int(state_to_str(state))) is not None:
-        #     return candidate_heuristic_val
+    def _lazy_correction(self, state: int, prev_blank: int, pending: Tuple[int, bool, int]) -> int:
+        """
+        How far (0 or 2) the optimistic -1 that _neighbors_with_delta(lazy=True) gave
+        `state` undershoots its true base_heuristic delta from its parent, whose blank was
+        at `prev_blank` and whose tile there slid into state's blank cell.
+        """
+        line, is_column, manhattan_delta = pending
+        bits = self._bits
+        blank_index = state >> self._blank_shift
+        tile = (state >> (bits * prev_blank)) & self._tile_mask
+        parent = (
+            state
+            ^ (tile << (bits * prev_blank))
+            ^ (tile << (bits * blank_index))
+            ^ ((blank_index ^ prev_blank) << self._blank_shift)
+        )
+        conflict_delta = self._line_conflicts(state, line, is_column) - self._line_conflicts(parent, line, is_column)
+        return manhattan_delta + conflict_delta + 1
+
+    def heuristic(self, state: int, depth: int = 1) -> int:
+        """Learned value for `state` if adjustment is on and it has one, else base_heuristic."""
+        if self.use_heuristic_adjustment:
+            # One lookup instead of `in` followed by indexing (values are never None)
+            learned = self._heuristic_cache.get(state)
+            if learned is not None:
+                return learned
+        return self.base_heuristic(state)
 
-        if self.use_heuristic_adjustment and state_to_str(state) in heuristic_cache:
-            # print(f"Cache hit for {state_to_str(state)}: {heuristic_cache[state_to_str(state)]}")
-            return heuristic_cache[state_to_str(state)]
+    def base_heuristic(self, state: int) -> int:
+        """
+        Manhattan distance plus linear conflicts (or the pattern-database heuristic, if
+        enabled): admissible, and ignores learned values.
+        """
+        if self._pattern_groups is not None:
+            return self.pattern_heuristic(state)
+        return self.manhattan(state) + self.linear_conflict(state)
+
+    def pattern_heuristic(self, state: int) -> int:
+        """Sum of each tile group's pattern-database entry (use_pattern_database only)."""
+        positions = self._tile_positions(state)
+        blank_index = state >> self._blank_shift
+        return sum(
+            table[((positions >> offset) & mask) | (blank_index << shift)]
+            for table, offset, mask, shift in self._pattern_groups
+        )
+
+    def _tile_positions(self, state: int) -> int:
+        """
+        The board inverted: tile t's cell in bits [4(t-1), 4t) (boards up to 4x4). Each
+        pattern group's placement is a bit field of it (see use_pattern_database).
+        """
+        positions = 0
+        for index, tile in enumerate(self._unpack(state)):
+            if tile:
+                positions |= index << (4 * (tile - 1))
+        return positions
 
+    def manhattan(self, state: int) -> int:
         """
         Summed Manhattan distance of each tile from its goal position.
         
         For tile x (1..N*N-1), its solved location is (row, col) = divmod(x-1, size).
-        The blank (0) is not counted.
-        """
-        size = self.size
-        distance_sum = 0
-        for index, tile in enumerate(state):
-            if tile != 0:
-                # Current position
-                row = index // size
-                col = index % size
-                # Goal position
-                goal_row = (tile - 1) // size
-                goal_col = (tile - 1) % size
-                distance_sum += abs(row - goal_row) + abs(col - goal_col)
-
-        value_to_return = distance_sum
-
-        if self.use_heuristic_adjustment:
-            heuristic_cache[state_to_str(state)] = value_to_return
-
-        return value_to_return
+        The blank (0) is not counted. Each term is a lookup in the precomputed distance table,
+        taken a byte of the packed state at a time where cells are at most 8 bits.
+        """
+        if self._byte_dist is not None:
+            raw = (state & self._cells_mask).to_bytes(len(self._byte_dist), 'little')
+            return sum(map(operator.getitem, self._byte_dist, raw))
+        return sum(map(operator.getitem, self._dist, self._unpack(state)))
 
-    def _reconstruct_path(self, end_state: Tuple[int], came_from: dict) -> List[Tuple[int]]:
+    def linear_conflict(self, state: int) -> int:
+        """
+        Extra moves beyond Manhattan distance forced by tiles that are in their goal row
+        (or column) but in the wrong order there: see _conflict_penalty.
         """
-        Reconstruct a full path from the final (goal) state back to the initial state.
+        line_conflicts = self._line_conflicts
+        return sum(
+            line_conflicts(state, line, False) + line_conflicts(state, line, True)
+            for line in range(self.size)
+        )
+
+    def _line_conflicts(self, state: int, line: int, is_column: bool) -> int:
+        """Linear-conflict penalty of a single row or column, read straight from the packed state."""
+        mask = self._tile_mask
+        if is_column:
+            shifts, goal_line, goal_along = self._col_shifts[line], self._goal_col, self._goal_row
+        else:
+            shifts, goal_line, goal_along = self._row_shifts[line], self._goal_row, self._goal_col
+        goal_positions = []
+        for shift in shifts:
+            tile = (state >> shift) & mask
+            if tile and goal_line[tile] == line:
+                goal_positions.append(goal_along[tile])
+        return _conflict_penalty(goal_positions)
+
+    def _reconstruct_path(self, end_state: int, g_scores: Dict[int, int]) -> List[Tuple[int, ...]]:
         """
-        path = [end_state]
-        while end_state in came_from:
-            end_state = came_from[end_state]
-            path.append(end_state)
-        path.reverse()
-        return path
+        Reconstruct a path from the initial state to end_state, unpacked into tuples.
 
-    def _reconstruct_partial_path(self, node: Tuple[int, int, Tuple[int], Optional[Tuple[int]]], came_from: dict) -> List[Tuple[int]]:
+        Every discovered state other than the start was pushed from a parent whose g-score
+        (which can only have dropped since) is lower, so stepping to any neighbor with a
+        lower g-score always makes progress and reaches the start (g = 0) in at most
+        g_scores[end_state] steps. Filled in back to front, so the list never grows.
+        """
+        get_g = g_scores.get
+        get_neighbors = self.get_neighbors
+        g = g_scores[end_state]
+        path = [None] * (g + 1)
+        i = g
+        path[i] = end_state
+        state = end_state
+        while g:
+            for neighbor in get_neighbors(state):
+                g_neighbor = get_g(neighbor)
+                if g_neighbor is not None and g_neighbor < g:
+                    break
+            state, g = neighbor, g_neighbor
+            i -= 1
+            path[i] = state
+        return [self._unpack(state) for state in path[i:]]
+
+    def _reconstruct_partial_path(self, node: Tuple[int, int, int, int], g_scores: Dict[int, int]) -> List[Tuple[int, ...]]:
         """
         Reconstruct from the best node so far (which might not be the goal).
-        Node is (f_val, g_val, state, parent_state).
+        Node is (f_val, g_val, state, prev_blank).
         """
         _, _, state, _ = node
-        return self._reconstruct_path(state, came_from)
+        return self._reconstruct_path(state, g_scores)
 
 
 # ------------------------------------------------------------------------------
@@ -246,4 +883,9 @@ if __name__ == "__main__":
         print(f"Step {idx}: {st}")
         
     # If solved == False, then we didn't get to the actual goal within max_expansions;
-    # the final path step is just the best (lowest f) node we saw so far.
+    # the final path step is just the best (lowest h) node we saw so far.
+
+    # The same puzzle with IDA* as the search strategy (same (path, solved) contract)
+    ida_solver = SlidingPuzzleAStar(initial_state=initial, size=size, max_expansions=5000, use_ida=True)
+    ida_path, ida_solved = ida_solver.resume(initial)
+    print(f"IDA* solved? {ida_solved}, number of states in path: {len(ida_path)}")